@@ -1,8 +1,26 @@
 import os
+import re
+import time
+import asyncio
+import hashlib
+import logging
 import datetime as dt
-from typing import List, Optional
+from contextlib import asynccontextmanager
+from collections import deque
+from functools import lru_cache
+from itertools import chain, zip_longest
+from uuid import uuid4
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 
-from fastapi import FastAPI, HTTPException
+import aiohttp
+import orjson
+import redis.asyncio as aioredis
+from redis.commands.search.field import TagField, TextField, VectorField
+from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+from redis.commands.search.query import Query as SearchQuery
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from prometheus_client import Counter, Gauge, make_asgi_app
 from pydantic import BaseModel, Field
 
 # Optional: muat .env saat dev
@@ -12,25 +30,34 @@ try:
 except Exception:
     pass
 
+logger = logging.getLogger(__name__)
+
 # ----------- Konfigurasi API Keys -----------
+# Dibaca saat import, tetapi baru divalidasi saat klien pertama kali dibuat
+# (lihat get_model / get_newsapi_headers) sehingga import modul tetap murah.
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 NEWSAPI_KEY = os.getenv("NEWSAPI_KEY")
 
-if not GEMINI_API_KEY:
-    raise RuntimeError("GEMINI_API_KEY belum diset. Tambahkan di environment.")
-if not NEWSAPI_KEY:
-    raise RuntimeError("NEWSAPI_KEY belum diset. Tambahkan di environment.")
 
-# ----------- Init Klien Gemini -----------
+def _require_env(name: str, value: Optional[str]) -> str:
+    if not value:
+        raise RuntimeError(f"{name} belum diset. Tambahkan di environment.")
+    return value
+
+# ----------- Init Klien Gemini (lazy, satu per proses) -----------
 import google.generativeai as genai
 
-genai.configure(api_key=GEMINI_API_KEY)
-GEMINI_MODEL_NAME = "gemini-1.5-flash"  # cepat & hemat; ganti ke 1.5-pro untuk analisis lebih dalam
+GEMINI_MODEL_NAME = "gemini-1.5-flash"  # default: cepat & hemat
+# Tier lain untuk routing /analyze (lihat pick_model_name)
+GEMINI_MODEL_LITE = "gemini-1.5-flash-8b"  # pertanyaan singkat tanpa konteks tambahan
+GEMINI_MODEL_PRO = "gemini-1.5-pro"  # analisis besar / banyak ticker
 
-model = genai.GenerativeModel(
-    model_name=GEMINI_MODEL_NAME,
-    system_instruction=(
-        """
+
+def approx_tokens(text: str) -> int:
+    # Perkiraan kasar ~4 karakter per token; cukup untuk keputusan routing
+    return len(text) // 4
+
+SYSTEM_INSTR = """
         Anda adalah asisten analitik keuangan & investasi yang berhati-hati dan edukatif.
         Batasan penting:
         - Ini bukan nasihat keuangan personal. Tekankan edukasi & alternatif skenario.
@@ -40,25 +67,291 @@ model = genai.GenerativeModel(
         - Hindari kepastian berlebihan; gunakan probabilitas kualitatif (mis. rendah/sedang/tinggi) bila relevan.
         - Gunakan bahasa Indonesia yang jelas dan ringkas.
         """
-    ),
+
+# Back-pressure: batasi panggilan Gemini yang sedang berjalan per proses agar
+# lonjakan request mengantre di sini, bukan menumpuk 429 di sisi Gemini.
+GEMINI_MAX_INFLIGHT = int(os.getenv("GEMINI_MAX_INFLIGHT", "16"))
+_gemini_sem = asyncio.Semaphore(GEMINI_MAX_INFLIGHT)
+
+GEMINI_INFLIGHT = Gauge("gemini_inflight_requests", "Panggilan Gemini yang sedang berjalan")
+GEMINI_WAITING = Gauge("gemini_waiting_requests", "Panggilan Gemini yang menunggu slot semaphore")
+Gauge("gemini_max_inflight", "Batas panggilan Gemini paralel per proses").set(GEMINI_MAX_INFLIGHT)
+
+
+@lru_cache(maxsize=1)
+def get_model() -> genai.GenerativeModel:
+    """Model Gemini per proses (tier default).
+
+    SYSTEM_INSTR (~300 token) jauh di bawah minimum explicit caching Gemini 1.5
+    (32768 token) sehingga tidak bisa di-cache eksplisit; sebagai gantinya bagian statis prompt selalu di depan
+    agar kena implicit prefix caching Gemini (lihat build_prompt).
+    """
+    # Transport default SDK adalah gRPC: satu channel HTTP/2 persisten yang
+    # di-multipleks antar request, jadi tidak ada handshake TLS per panggilan.
+    genai.configure(api_key=_require_env("GEMINI_API_KEY", GEMINI_API_KEY))
+    return genai.GenerativeModel(model_name=GEMINI_MODEL_NAME, system_instruction=SYSTEM_INSTR)
+
+
+@lru_cache(maxsize=1)
+def get_models() -> Dict[str, genai.GenerativeModel]:
+    """Semua tier model per proses; tier default memakai get_model()."""
+    return {
+        GEMINI_MODEL_LITE: genai.GenerativeModel(model_name=GEMINI_MODEL_LITE, system_instruction=SYSTEM_INSTR),
+        GEMINI_MODEL_NAME: get_model(),
+        GEMINI_MODEL_PRO: genai.GenerativeModel(model_name=GEMINI_MODEL_PRO, system_instruction=SYSTEM_INSTR),
+    }
+
+
+SESSION_TTL = 3600  # detik; masa berlaku sesi
+
+
+# ----------- Init NewsAPI (HTTP async) -----------
+NEWSAPI_URL = "https://newsapi.org/v2/everything"
+NEWSAPI_WARMUP_URL = "https://newsapi.org/"
+
+# Satu ClientSession per proses; dibuat saat startup & ditutup saat shutdown
+http_session: Optional[aiohttp.ClientSession] = None
+
+
+class CircuitBreaker:
+    """Circuit breaker sederhana berbasis rasio gagal dalam jendela waktu bergulir.
+
+    Terbuka bila >= failure_ratio dari panggilan dalam `window` detik terakhir gagal
+    (minimal `min_calls` panggilan); selama `cooldown` detik panggilan langsung ditolak.
+    """
+
+    def __init__(self, window: float = 30, failure_ratio: float = 0.5, cooldown: float = 30, min_calls: int = 5):
+        self.window = window
+        self.failure_ratio = failure_ratio
+        self.cooldown = cooldown
+        self.min_calls = min_calls
+        self._calls = deque()  # (waktu, sukses)
+        self._open_until = 0.0
+
+    def _trim(self, now: float) -> None:
+        while self._calls and self._calls[0][0] < now - self.window:
+            self._calls.popleft()
+
+    @property
+    def is_open(self) -> bool:
+        return time.monotonic() < self._open_until
+
+    def record(self, ok: bool) -> None:
+        now = time.monotonic()
+        self._calls.append((now, ok))
+        self._trim(now)
+        if len(self._calls) < self.min_calls:
+            return
+        failures = sum(1 for _, success in self._calls if not success)
+        if failures / len(self._calls) >= self.failure_ratio:
+            self._open_until = now + self.cooldown
+            self._calls.clear()
+
+
+newsapi_breaker = CircuitBreaker()
+Gauge("newsapi_circuit_open", "1 bila circuit breaker NewsAPI sedang terbuka").set_function(
+    lambda: float(newsapi_breaker.is_open)
 )
 
-# ----------- Init NewsAPI -----------
-from newsapi import NewsApiClient
 
-newsapi = NewsApiClient(api_key=NEWSAPI_KEY)
+@lru_cache(maxsize=1)
+def get_newsapi_headers() -> dict:
+    return {"X-Api-Key": _require_env("NEWSAPI_KEY", NEWSAPI_KEY)}
+
+# Batas request NewsAPI paralel per proses (fan-out per ticker menghormati rate limit)
+NEWSAPI_MAX_CONCURRENCY = 5
+_newsapi_sem = asyncio.Semaphore(NEWSAPI_MAX_CONCURRENCY)
+
+# ----------- Cache (Redis, fallback memori untuk dev) -----------
+REDIS_URL = os.getenv("REDIS_URL")
+NEWS_CACHE_TTL = 300  # detik; hasil NewsAPI untuk query yang sama relatif stabil
+ANALYZE_CACHE_TTL = 60  # detik; cukup untuk meredam pertanyaan identik beruntun
+
+
+class _MemoryCache:
+    """Pengganti minimal Redis (get/setex) saat REDIS_URL tidak diset."""
+
+    def __init__(self):
+        self._data = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires < time.monotonic():
+            self._data.pop(key, None)
+            return None
+        return value
+
+    async def setex(self, key: str, ttl: int, value: bytes) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+
+    async def set(self, key: str, value: bytes, nx: bool = False, ex: Optional[int] = None) -> bool:
+        if nx and await self.get(key) is not None:
+            return False
+        self._data[key] = (time.monotonic() + (ex if ex is not None else float("inf")), value)
+        return True
+
+    async def aclose(self) -> None:
+        self._data.clear()
+
+
+cache = None  # diinisialisasi saat startup
+
+
+def _cache_key(prefix: str, params: dict) -> str:
+    return prefix + hashlib.sha1(orjson.dumps(params, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+async def cache_get_bytes(key: str) -> Optional[bytes]:
+    """Ambil bytes mentah dari cache; error cache tidak boleh menggagalkan request."""
+    try:
+        return await cache.get(key)
+    except Exception as e:
+        logger.warning("Cache get gagal (%s): %s", key, e)
+        return None
+
+
+async def cache_set_bytes(key: str, ttl: int, payload: bytes) -> None:
+    try:
+        await cache.setex(key, ttl, payload)
+    except Exception as e:
+        logger.warning("Cache set gagal (%s): %s", key, e)
+
+
+# ----------- Single-flight: satukan request identik yang sedang berjalan -----------
+_inflight: Dict[str, asyncio.Task] = {}
+
+
+async def single_flight(key: str, factory: Callable[[], Awaitable]):
+    """Jalankan factory() sekali per key; pemanggil bersamaan menunggu hasil yang sama.
+
+    Pekerjaan berjalan sebagai task terpisah (di-shield), sehingga bila pemanggil
+    pertama terputus, pemanggil lain tetap mendapat hasilnya. Pendaftaran tidak
+    butuh lock: tidak ada await di antara cek dan set pada event loop tunggal.
+    """
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        _inflight[key] = task
+
+        def _done(t: asyncio.Task) -> None:
+            _inflight.pop(key, None)
+            if not t.cancelled():
+                t.exception()  # tandai sudah diambil walau semua penunggu batal
+
+        task.add_done_callback(_done)
+    return await asyncio.shield(task)
+
+
+async def cache_get(key: str):
+    cached = await cache_get_bytes(key)
+    return orjson.loads(cached) if cached else None
+
+
+async def cache_set(key: str, ttl: int, value) -> None:
+    await cache_set_bytes(key, ttl, orjson.dumps(value))
+
+# ----------- Semantic cache (opsional: Redis Stack + sentence-transformers) -----------
+# Pertanyaan yang maknanya hampir sama (cosine >= SEMANTIC_MIN_SIM) dengan konteks
+# berita & profil identik dijawab dari jawaban sebelumnya tanpa memanggil Gemini.
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE", "1") != "0"
+SEMANTIC_INDEX = "qcache"
+SEMANTIC_PREFIX = "qcache:"
+SEMANTIC_MIN_SIM = 0.95
+SEMANTIC_TTL = 3600
+EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBED_DIM = 384
+
+embedder = None  # SentenceTransformer; None berarti semantic cache nonaktif
+
+
+async def _enable_semantic_cache() -> None:
+    global embedder
+    if not (REDIS_URL and SEMANTIC_CACHE_ENABLED):
+        return
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        logger.info("sentence-transformers tidak terpasang; semantic cache nonaktif")
+        return
+    index = cache.ft(SEMANTIC_INDEX)
+    try:
+        try:
+            await index.info()
+        except aioredis.ResponseError:
+            await index.create_index(
+                [
+                    VectorField(
+                        "vec", "HNSW", {"TYPE": "FLOAT32", "DIM": EMBED_DIM, "DISTANCE_METRIC": "COSINE"}
+                    ),
+                    TagField("ctx"),
+                    TextField("answer", no_stem=True),
+                ],
+                definition=IndexDefinition(prefix=[SEMANTIC_PREFIX], index_type=IndexType.HASH),
+            )
+    except Exception as e:
+        # mis. Redis tanpa modul search
+        logger.warning("Semantic cache nonaktif: %s", e)
+        return
+    embedder = await asyncio.to_thread(SentenceTransformer, EMBED_MODEL_NAME)
+
+
+def _semantic_ctx(lang: str, profile_text: Optional[str], articles: List[dict]) -> str:
+    """Hash jendela berita + profil; jawaban hanya dipakai ulang bila konteksnya sama."""
+    return hashlib.sha1(
+        orjson.dumps([lang, profile_text, [a.get("url") for a in articles]])
+    ).hexdigest()
+
+
+async def semantic_lookup(question: str, ctx: str) -> Tuple[Optional[str], Optional[bytes]]:
+    """Kembalikan (jawaban_cache_atau_None, vektor_pertanyaan) untuk dipakai semantic_store."""
+    if embedder is None:
+        return None, None
+    vec = await asyncio.to_thread(embedder.encode, question, normalize_embeddings=True)
+    vec = vec.astype("float32").tobytes()
+    query = (
+        SearchQuery(f"(@ctx:{{{ctx}}})=>[KNN 1 @vec $vec AS dist]")
+        .sort_by("dist")
+        .return_fields("answer", "dist")
+        .dialect(2)
+    )
+    try:
+        res = await cache.ft(SEMANTIC_INDEX).search(query, query_params={"vec": vec})
+    except Exception as e:
+        logger.warning("Semantic cache lookup gagal: %s", e)
+        return None, vec
+    # Jarak COSINE di RediSearch = 1 - similarity
+    if res.docs and 1 - float(res.docs[0].dist) >= SEMANTIC_MIN_SIM:
+        return res.docs[0].answer, vec
+    return None, vec
+
+
+async def semantic_store(vec: Optional[bytes], ctx: str, answer: str) -> None:
+    if vec is None:
+        return
+    key = SEMANTIC_PREFIX + hashlib.sha1(vec + ctx.encode()).hexdigest()
+    try:
+        async with cache.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping={"vec": vec, "ctx": ctx, "answer": answer})
+            pipe.expire(key, SEMANTIC_TTL)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning("Semantic cache store gagal: %s", e)
 
 # ----------- Skema Request/Response -----------
 class InvestorProfile(BaseModel):
     risiko: Optional[str] = Field(
         default=None,
+        max_length=32,
         description="Toleransi risiko: rendah/sedang/tinggi"
     )
     horizon_bulan: Optional[int] = Field(
         default=None, ge=1, description="Horizon investasi dalam bulan"
     )
     fokus: Optional[str] = Field(
-        default=None, description="Fokus: mis. saham, obligasi, ETF, kripto, properti"
+        default=None, max_length=200, description="Fokus: mis. saham, obligasi, ETF, kripto, properti"
     )
 
 class AnalyzeRequest(BaseModel):
@@ -68,6 +361,22 @@ class AnalyzeRequest(BaseModel):
     hari_kebelakang: int = Field(default=7, ge=1, le=30, description="Seberapa jauh ambil berita (hari)")
     bahasa: str = Field(default="id", description="Kode bahasa NewsAPI, mis. id atau en")
     profil: Optional[InvestorProfile] = None
+    max_output_tokens: Optional[int] = Field(
+        default=None, ge=64, le=4096, description="Batas token jawaban (default ANALYZE_GEN_CFG)"
+    )
+    temperature: Optional[float] = Field(default=None, ge=0, le=2, description="Override temperature Gemini")
+
+# Skema output terstruktur Gemini (response_schema)
+class Suggestions(BaseModel):
+    suggestions: List[str] = Field(..., description="Daftar pertanyaan, satu kalimat per item")
+
+class AnalysisResult(BaseModel):
+    summary: str = Field(..., description="Jawaban: langkah analisis ringkas dan opsi alternatif")
+    bullets: List[str] = Field(..., description="Ringkasan eksekutif, 3–5 poin")
+    risks: List[str] = Field(..., description="Poin risiko utama")
+
+class BootstrapRequest(AnalyzeRequest):
+    topik: Optional[str] = Field(default=None, description="Fokus saran pertanyaan (opsional)")
 
 class NewsQuery(BaseModel):
     q: str
@@ -82,92 +391,238 @@ def _fmt_date(d: dt.date) -> str:
     return d.strftime("%Y-%m-%d")
 
 
-def fetch_news(q: str, language: str = "id", from_days: int = 7, page_size: int = 10):
-    """Ambil berita dari NewsAPI (everything endpoint)."""
-    today = dt.date.today()
-    frm = today - dt.timedelta(days=from_days)
-    res = newsapi.get_everything(
-        q=q,
-        language=language,
-        from_param=_fmt_date(frm),
-        to=_fmt_date(today),
-        sort_by="publishedAt",
-        page=1,
-        page_size=page_size,
-    )
-    if res.get("status") != "ok":
-        raise HTTPException(status_code=502, detail=f"Gagal memuat berita: {res}")
-    articles = res.get("articles", [])
+@lru_cache(maxsize=64)
+def _date_range(today: dt.date, from_days: int) -> Tuple[str, str]:
+    """(dari, sampai) terformat; di-cache per hari agar fan-out tidak memformat ulang."""
+    return _fmt_date(today - dt.timedelta(days=from_days)), _fmt_date(today)
+
+
+async def fetch_news_raw(params: dict) -> dict:
+    """GET langsung ke endpoint everything NewsAPI (tanpa wrapper klien), kembalikan body JSON.
+
+    `params` memakai nama parameter API apa adanya (q, language, from, to, sortBy, page, pageSize).
+    """
+    if newsapi_breaker.is_open:
+        # Gagal cepat selama NewsAPI bermasalah; hasil yang ada di cache tetap dilayani
+        raise HTTPException(status_code=503, detail="NewsAPI sedang tidak tersedia, coba lagi nanti.")
+    try:
+        async with _newsapi_sem, http_session.get(
+            NEWSAPI_URL, params=params, headers=get_newsapi_headers()
+        ) as r:
+            status = r.status
+            # content_type=None: body error NewsAPI tetap JSON walau header-nya tidak selalu tepat
+            res = await r.json(loads=orjson.loads, content_type=None) or {}
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        newsapi_breaker.record(False)
+        raise HTTPException(status_code=502, detail=f"Gagal memuat berita: {e}")
+    # Hanya gangguan di sisi upstream (5xx / rate limit) yang dihitung gagal
+    newsapi_breaker.record(status < 500 and status != 429)
+    return res
+
+
+def _map_articles(raw: List[dict]) -> List[dict]:
+    """Ambil field yang dipakai saja dari artikel NewsAPI."""
+    get = dict.get  # hindari lookup atribut .get berulang per artikel
     return [
         {
-            "judul": a.get("title"),
-            "sumber": a.get("source", {}).get("name"),
-            "url": a.get("url"),
-            "publishedAt": a.get("publishedAt"),
-            "ringkas": a.get("description"),
+            "judul": get(a, "title"),
+            "sumber": get(get(a, "source") or {}, "name"),
+            "url": get(a, "url"),
+            "publishedAt": get(a, "publishedAt"),
+            "ringkas": get(a, "description"),
         }
-        for a in articles
+        for a in raw
     ]
 
 
+NEWS_FETCH_PAGE_SIZE = 10  # selalu ambil satu halaman penuh; pemanggil memotong sesuai kebutuhan
+
+NEWS_CACHE_HITS = Counter("news_cache_hits", "fetch_news dilayani dari cache")
+NEWS_CACHE_MISSES = Counter("news_cache_misses", "fetch_news harus memanggil NewsAPI")
+
+
+def _news_params(q: str, language: str, from_days: int) -> dict:
+    frm, to = _date_range(dt.date.today(), from_days)
+    return {
+        "q": q,
+        "language": language,
+        "from": frm,
+        "to": to,
+        "sortBy": "publishedAt",
+        "page": 1,
+        "pageSize": NEWS_FETCH_PAGE_SIZE,
+    }
+
+
+async def _load_news(params: dict, ttl: int) -> List[dict]:
+    """Panggil NewsAPI untuk params dan simpan hasilnya ke cache."""
+    res = await fetch_news_raw(params)
+    if res.get("status") != "ok":
+        raise HTTPException(status_code=502, detail=f"Gagal memuat berita: {res}")
+    articles = _map_articles(res.get("articles") or [])
+    await cache_set(_cache_key("news:", params), ttl, articles)
+    return articles
+
+
+async def fetch_news(q: str, language: str = "id", from_days: int = 7, page_size: int = 10):
+    """Ambil berita dari NewsAPI (everything endpoint), cache dulu."""
+    # page_size tidak masuk key cache sehingga semua pemanggil (dan refresh_loop) berbagi entri
+    params = _news_params(q, language, from_days)
+    key = _cache_key("news:", params)
+    if from_days == HOT_NEWS_DAYS and (q, language) in _HOT_NEWS:
+        _mark_hot_read(q, language)
+    cached = await cache_get(key)
+    if cached is not None:
+        NEWS_CACHE_HITS.inc()
+        return cached[:page_size]
+    NEWS_CACHE_MISSES.inc()
+    # Cache miss serentak untuk query yang sama hanya memicu satu panggilan NewsAPI
+    articles = await single_flight(key, lambda: _load_news(params, NEWS_CACHE_TTL))
+    return articles[:page_size]
+
+
+# ----------- Refresh berita populer di background (stale-while-revalidate) -----------
+# Opt-in: refresh hanya berjalan bila HOT_NEWS_QUERIES diset, karena tiap putaran memakai
+# kuota NewsAPI (429 berulang akan membuka circuit breaker). Secara default tidak ada
+# query yang di-refresh, termasuk query fallback /analyze. Contoh:
+#   HOT_NEWS_QUERIES="ekonomi OR pasar saham OR IHSG|id;inflation|en"
+# Format "query|bahasa;query|bahasa" (bahasa opsional, default "id").
+HOT_NEWS_QUERIES = os.getenv("HOT_NEWS_QUERIES", "")
+HOT_NEWS_DAYS = 7  # sama dengan default hari_kebelakang /analyze agar key cache cocok
+NEWS_REFRESH_INTERVAL = int(os.getenv("NEWS_REFRESH_INTERVAL", "60"))
+NEWS_REFRESH_TTL = 2 * NEWS_REFRESH_INTERVAL  # entri tetap hidup walau satu putaran refresh gagal
+_news_refresh_task: Optional[asyncio.Task] = None
+_news_read_tasks: Set[asyncio.Task] = set()  # referensi kuat agar task tidak di-GC
+
+
+def _parse_hot_queries(raw: str) -> List[Tuple[str, str]]:
+    pairs = []
+    for item in raw.split(";"):
+        q, _, lang = item.partition("|")
+        if q.strip():
+            pairs.append((q.strip(), lang.strip() or "id"))
+    return pairs
+
+
+_HOT_NEWS = set(_parse_hot_queries(HOT_NEWS_QUERIES))
+
+
+def _mark_hot_read(q: str, language: str) -> None:
+    """Tandai query populer "dibaca" untuk refresh_loop tanpa menahan request.
+
+    Tanda kedaluwarsa sendiri setelah satu interval; SETEX berjalan sebagai task
+    terpisah sehingga jalur baca tetap satu round-trip cache.
+    """
+    task = asyncio.create_task(cache_set_bytes(f"news_read:{language}:{q}", NEWS_REFRESH_INTERVAL, b"1"))
+    _news_read_tasks.add(task)
+    task.add_done_callback(_news_read_tasks.discard)
+
+
+async def refresh_loop() -> None:
+    """Segarkan query populer ke cache secara berkala.
+
+    Dengan Redis, lock SET NX memastikan hanya satu worker per interval yang
+    memanggil NewsAPI; worker lain cukup membaca hasilnya dari cache. Query
+    yang tidak dibaca sejak interval terakhir dilewati agar kuota tidak terbuang.
+    """
+    while True:
+        try:
+            if await cache.set("news_refresh:lock", b"1", nx=True, ex=NEWS_REFRESH_INTERVAL):
+                for q, lang in _HOT_NEWS:
+                    if await cache_get_bytes(f"news_read:{lang}:{q}") is None:
+                        continue
+                    try:
+                        await _load_news(_news_params(q, lang, HOT_NEWS_DAYS), NEWS_REFRESH_TTL)
+                    except HTTPException as e:
+                        logger.warning("Refresh berita %r gagal: %s", q, e.detail)
+        except Exception as e:
+            logger.warning("Putaran refresh berita gagal: %s", e)
+        await asyncio.sleep(NEWS_REFRESH_INTERVAL)
+
+
+MAX_ARTICLES = 5  # jumlah artikel yang masuk ke prompt /analyze
+PER_TERM_PAGE_SIZE = 4  # artikel per ticker/kata kunci saat fan-out
+DESC_MAX_CHARS = 200  # potong ringkasan artikel agar token input tetap kecil
+MAX_PROMPT_CHARS = 6000  # anggaran total prompt; konteks berita dipangkas bila lewat
+
+
 def build_news_context(articles: List[dict]) -> str:
     if not articles:
         return "Tidak ada artikel relevan yang ditemukan dalam jangka waktu yang ditentukan."
-    lines = ["Artikel Berita Terkait (ringkasan singkat):"]
+    lines = ["Berita terkait:"]
     for i, a in enumerate(articles, 1):
-        when = a.get("publishedAt", "")
+        when = a.get("publishedAt") or ""
         lines.append(
-            f"{i}. [{a['judul']}]({a['url']}) — {a['sumber']} — {when}\n   Ringkas: {a.get('ringkas') or '-'}"
+            f"{i}. {a['judul']} — {a['sumber']} — {when[:10]}: {(a.get('ringkas') or '')[:DESC_MAX_CHARS]}"
         )
     return "\n".join(lines)
 
 
-def build_prompt(user_q: str, profile: Optional[InvestorProfile], news_ctx: str) -> List[dict]:
-    # Gunakan format "content parts" untuk memberi konteks terstruktur
-    parts = []
-    if profile:
-        parts.append(
-            {
-                "text": (
-                    "Profil Investor:\n"
-                    f"- Risiko: {profile.risiko or '-'}\n"
-                    f"- Horizon (bulan): {profile.horizon_bulan or '-'}\n"
-                    f"- Fokus: {profile.fokus or '-'}\n"
-                )
-            }
-        )
-    parts.append({"text": news_ctx})
-    parts.append({
-        "text": (
-            "Tugas:\n"
-            "- Jawab pertanyaan pengguna di bawah ini.\n"
-            "- Gunakan konteks berita di atas jika relevan.\n"
-            "- Sertakan langkah analisis ringkas, poin risiko, dan opsi alternatif.\n"
-            "- Akhiri dengan ringkasan eksekutif (3–5 poin bullet).\n"
-            "- Tambahkan penafian singkat bahwa ini bukan nasihat keuangan personal.\n"
-        )
-    })
-    parts.append({"text": f"Pertanyaan Pengguna: {user_q}"})
-    return parts
+# Bagian statis prompt ditaruh paling depan agar prefix identik lintas request
+# (implicit prefix caching Gemini); bagian dinamis menyusul di belakang.
+TASK_TEMPLATE = (
+    "Tugas: jawab pertanyaan di akhir memakai profil & berita di bawah bila relevan, "
+    "dengan analisis ringkas, risiko, dan alternatif.\n"
+)
 
+_PROFILE_FIELDS = (
+    ("fokus", "Fokus"),
+    ("horizon_bulan", "Horizon (bulan)"),
+    ("risiko", "Risiko"),
+)
 
-# ----------- FastAPI App -----------
-app = FastAPI(title="AI Pakar Keuangan & Investasi (Gemini + NewsAPI)")
 
+def build_profile_part(profile: Optional[InvestorProfile]) -> Optional[str]:
+    """Bentuk kanonik (urutan tetap, '-' untuk kosong) agar byte-stabil; None jika profil kosong."""
+    if profile is None:
+        return None
+    values = [getattr(profile, field) for field, _ in _PROFILE_FIELDS]
+    if all(v is None for v in values):
+        return None
+    lines = ["Profil Investor:"]
+    lines.extend(f"- {label}: {v if v is not None else '-'}" for (_, label), v in zip(_PROFILE_FIELDS, values))
+    return "\n".join(lines) + "\n"
 
-@app.get("/")
-def root():
-    return {
-        "name": "AI Pakar Keuangan & Investasi",
-        "model": GEMINI_MODEL_NAME,
-        "endpoints": ["/analyze", "/news", "/suggest-questions"],
-        "disclaimer": "Informasi bersifat edukatif, bukan nasihat keuangan personal.",
-    }
 
+def _truncate_lines(text: str, budget: int) -> str:
+    """Potong teks di batas baris agar panjangnya <= budget."""
+    if budget <= 0:
+        # Indeks akhir negatif pada rfind dihitung dari belakang; tangani eksplisit
+        return ""
+    if len(text) <= budget:
+        return text
+    cut = text.rfind("\n", 0, budget)
+    return text[:cut] if cut > 0 else text[:budget]
 
-@app.post("/analyze")
-def analyze(req: AnalyzeRequest):
-    # 1) Rangkai query berita
+
+def build_prompt_prefix(profile: Optional[InvestorProfile]) -> List[dict]:
+    """Bagian prompt yang stabil per sesi: tugas + profil (bila ada)."""
+    parts = [{"text": TASK_TEMPLATE}]
+    profile_text = build_profile_part(profile)
+    if profile_text:
+        parts.append({"text": profile_text})
+    return parts
+
+
+def build_prompt(
+    user_q: str,
+    profile: Optional[InvestorProfile],
+    news_ctx: str,
+    max_prompt_chars: int = MAX_PROMPT_CHARS,
+) -> List[dict]:
+    # Gunakan format "content parts" untuk memberi konteks terstruktur.
+    # Urutan: tugas (statis) -> profil (per sesi) -> berita (per request) -> pertanyaan.
+    parts = build_prompt_prefix(profile)
+    question = f"Pertanyaan Pengguna: {user_q}"
+    used = sum(len(p["text"]) for p in parts) + len(question)
+    news_ctx = _truncate_lines(news_ctx, max_prompt_chars - used)
+    if news_ctx:  # Gemini menolak part teks kosong
+        parts.append({"text": news_ctx})
+    parts.append({"text": question})
+    return parts
+
+
+def build_news_terms(req: AnalyzeRequest) -> List[str]:
     terms = []
     if req.kata_kunci:
         terms.append(req.kata_kunci)
@@ -176,79 +631,521 @@ def analyze(req: AnalyzeRequest):
     if not terms:
         # fallback: ambil berita umum ekonomi/market
         terms = ["ekonomi OR pasar saham OR IHSG"]
+    return terms
 
-    q = " OR ".join(terms)
 
-    # 2) Ambil berita
-    articles = fetch_news(q=q, language=req.bahasa, from_days=req.hari_kebelakang, page_size=8)
-    news_ctx = build_news_context(articles)
+async def fetch_news_multi(
+    terms: List[str], language: str, from_days: int, limit: int = MAX_ARTICLES
+) -> List[dict]:
+    """Ambil berita per term secara paralel, lalu gabung bergiliran & dedupe per URL.
+
+    Satu query "A OR B OR C" diurutkan global per publishedAt sehingga sebagian
+    ticker bisa tidak kebagian artikel; per-term fan-out memberi cakupan seimbang.
+    """
+    if len(terms) == 1:
+        return await fetch_news(terms[0], language=language, from_days=from_days, page_size=limit)
+
+    results = await asyncio.gather(
+        *[
+            fetch_news(t, language=language, from_days=from_days, page_size=PER_TERM_PAGE_SIZE)
+            for t in terms
+        ],
+        return_exceptions=True,
+    )
+    groups = []
+    for term, r in zip(terms, results):
+        if isinstance(r, BaseException):
+            # Term yang gagal dilewati; catat agar cakupan yang berkurang tetap terlihat
+            logger.warning("Berita untuk term %r gagal dimuat: %s", term, getattr(r, "detail", r))
+        else:
+            groups.append(r)
+    if not groups:
+        raise results[0]
+
+    seen = set()
+    merged = []
+    for a in chain.from_iterable(zip_longest(*groups)):
+        if a is None or a["url"] in seen:
+            continue
+        seen.add(a["url"])
+        merged.append(a)
+        if len(merged) == limit:
+            break
+    return merged
+
+
+def build_suggest_prompt(topik: Optional[str]) -> str:
+    prompt = (
+        "Buat 8 pertanyaan tajam seputar keuangan/investasi untuk membantu analisis. "
+        "Variasikan dari makro, sektor, emiten, manajemen risiko, dan perencanaan keuangan. "
+    )
+    if topik:
+        prompt += f"Fokus utama: {topik}. "
+    return prompt
+
+
+# Satu baris saran: buang satu penanda daftar di depan (bullet "-", "•", "*" atau
+# penomoran "1." / "2)" yang diikuti spasi) dan spasi di belakang; angka yang bagian
+# dari isi ("3.5% inflasi ...") tetap utuh. Baris kosong dilewati.
+_SUGG_RE = re.compile(r"^\s*(?:[-•*]|\d+[.)](?=\s))?\s*(\S.*?)\s*$", re.M)
 
-    # 3) Bangun prompt & panggil Gemini
-    parts = build_prompt(req.pertanyaan, req.profil, news_ctx)
 
+def parse_suggestions(teks: str) -> List[str]:
+    """Parser toleran: tiap baris tidak kosong menjadi satu saran."""
+    return [m.group(1) for m in _SUGG_RE.finditer(teks)]
+
+
+# Pemulihan JSON terpotong (mis. berhenti di max_output_tokens): ambil hanya
+# string yang sudah lengkap, jangan teruskan potongan JSON mentah ke klien.
+_JSON_STR_RE = re.compile(r'\s*,?\s*"((?:[^"\\]|\\.)*)"')
+
+
+def _json_field_strings(teks: str, field: str) -> List[str]:
+    """String lengkap milik `field` ("field": "..." atau "field": ["...", ...])."""
+    m = re.search(rf'"{field}"\s*:\s*(\[?)', teks)
+    if m is None:
+        return []
+    items, pos = [], m.end()
+    while (item := _JSON_STR_RE.match(teks, pos)) is not None:
+        try:
+            items.append(orjson.loads(f'"{item.group(1)}"'))
+        except orjson.JSONDecodeError:
+            break
+        pos = item.end()
+        if not m.group(1):  # nilai skalar: cukup satu string
+            break
+    return items
+
+
+def _looks_like_json(teks: str) -> bool:
+    return teks.lstrip().startswith(("{", "["))
+
+
+def parse_analysis(teks: str) -> dict:
+    """JSON AnalysisResult dari Gemini; JSON rusak dipulihkan sebisanya, prosa jadi summary."""
     try:
-        resp = model.generate_content(parts)
-        teks = resp.text
+        return AnalysisResult.model_validate_json(teks).model_dump()
+    except ValueError:
+        if not _looks_like_json(teks):
+            return {"summary": teks, "bullets": [], "risks": []}
+        return {
+            "summary": "".join(_json_field_strings(teks, "summary")),
+            "bullets": _json_field_strings(teks, "bullets"),
+            "risks": _json_field_strings(teks, "risks"),
+        }
+
+
+def parse_suggestions_json(teks: str) -> List[str]:
+    try:
+        return Suggestions.model_validate_json(teks).suggestions
+    except ValueError:
+        if _looks_like_json(teks):
+            return _json_field_strings(teks, "suggestions")
+        return parse_suggestions(teks)
+
+
+# response_schema diberi kelas Pydantic (bukan model_json_schema()): SDK genai
+# mengonversinya sendiri dan menolak key seperti "title"/"$defs" dari JSON Schema mentah.
+# max_output_tokens membatasi jumlah langkah decode, tuas latensi terbesar di sisi output.
+ANALYZE_GEN_CFG = {
+    "response_mime_type": "application/json",
+    "response_schema": AnalysisResult,
+    "max_output_tokens": 1200,
+    "candidate_count": 1,
+    "temperature": 0.4,
+}
+SUGGEST_GEN_CFG = {
+    "response_mime_type": "application/json",
+    "response_schema": Suggestions,
+    "max_output_tokens": 400,
+    "candidate_count": 1,
+    "temperature": 0.7,
+}
+
+
+def gen_config(base: dict, max_output_tokens: Optional[int] = None, temperature: Optional[float] = None) -> dict:
+    """Salin generation_config dasar dengan override opsional dari request."""
+    cfg = dict(base)
+    if max_output_tokens is not None:
+        cfg["max_output_tokens"] = max_output_tokens
+    if temperature is not None:
+        cfg["temperature"] = temperature
+    return cfg
+
+
+@asynccontextmanager
+async def _gemini_slot():
+    with GEMINI_WAITING.track_inprogress():
+        await _gemini_sem.acquire()
+    try:
+        with GEMINI_INFLIGHT.track_inprogress():
+            yield
+    finally:
+        _gemini_sem.release()
+
+
+async def generate_text(
+    contents, generation_config: Optional[dict] = None, model: Optional[genai.GenerativeModel] = None
+) -> str:
+    """Panggil Gemini secara async dan kembalikan teks jawabannya."""
+    try:
+        async with _gemini_slot():
+            resp = await (model or get_model()).generate_content_async(
+                contents, generation_config=generation_config
+            )
+        return resp.text
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Gagal memanggil Gemini: {e}")
 
+
+async def stream_text(
+    contents, generation_config: Optional[dict] = None, model: Optional[genai.GenerativeModel] = None
+) -> AsyncIterator[str]:
+    """Seperti generate_text, tetapi mengalirkan potongan teks begitu tersedia."""
+    # Slot dipegang sampai stream selesai karena koneksi ke Gemini masih terpakai
+    async with _gemini_slot():
+        resp = await (model or get_model()).generate_content_async(
+            contents, generation_config=generation_config, stream=True
+        )
+        async for chunk in resp:
+            yield chunk.text
+
+
+# ----------- Server-Sent Events -----------
+# Protokol: satu event "meta", lalu event tanpa nama berisi {"delta": ...}
+# (potongan teks JSON mentah), diakhiri "done" berisi hasil yang sudah di-parse
+# (atau "error" bila Gemini gagal di tengah jalan).
+
+def _sse(data: dict, event: Optional[str] = None) -> bytes:
+    line = b"data: " + orjson.dumps(data) + b"\n\n"
+    return f"event: {event}\n".encode() + line if event else line
+
+
+def _sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _sse_replay(result: dict) -> StreamingResponse:
+    """Putar ulang jawaban yang sudah jadi (dari cache) dengan protokol SSE yang sama."""
+    meta = dict(result)
+    answer = meta.pop("answer")
+    delta = orjson.dumps(answer).decode()
+    return _sse_response(
+        iter([_sse(meta, "meta"), _sse({"delta": delta}), _sse({"answer": answer}, "done")])
+    )
+
+
+async def _sse_generate(
+    meta: dict,
+    contents,
+    finalize: Callable[[str], Awaitable[dict]],
+    generation_config: Optional[dict] = None,
+    model: Optional[genai.GenerativeModel] = None,
+) -> AsyncIterator[bytes]:
+    yield _sse(meta, "meta")
+    chunks = []
+    try:
+        async for delta in stream_text(contents, generation_config, model):
+            chunks.append(delta)
+            yield _sse({"delta": delta})
+    except Exception as e:
+        yield _sse({"detail": f"Gagal memanggil Gemini: {e}"}, "error")
+        return
+    yield _sse(await finalize("".join(chunks)), "done")
+
+
+async def _warm_newsapi_connection() -> None:
+    """Resolve DNS & buka koneksi TLS ke NewsAPI lebih awal; koneksi masuk pool keep-alive."""
+    try:
+        async with http_session.head(
+            NEWSAPI_WARMUP_URL, timeout=aiohttp.ClientTimeout(total=3)
+        ) as r:
+            await r.release()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.info("Warm-up koneksi NewsAPI gagal (diabaikan): %s", e)
+
+
+# ----------- FastAPI App -----------
+app = FastAPI(
+    title="AI Pakar Keuangan & Investasi (Gemini + NewsAPI)",
+    default_response_class=ORJSONResponse,
+)
+app.mount("/metrics", make_asgi_app())
+
+
+@app.on_event("startup")
+async def _startup():
+    global http_session, cache, _news_refresh_task
+    # Pool koneksi keep-alive: batasi socket agar lonjakan request tidak membanjiri
+    # NewsAPI, cache DNS, dan pertahankan koneksi TLS untuk dipakai ulang.
+    http_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=100, limit_per_host=20, ttl_dns_cache=300, keepalive_timeout=60
+        ),
+        timeout=aiohttp.ClientTimeout(total=10),
+    )
+    await _warm_newsapi_connection()
+    if REDIS_URL:
+        cache = aioredis.Redis.from_url(REDIS_URL)
+    else:
+        cache = _MemoryCache()
+
+    # Panaskan singleton agar request pertama tidak menanggung biaya init
+    get_newsapi_headers()
+    await asyncio.to_thread(get_models)
+
+    await _enable_semantic_cache()
+
+    if HOT_NEWS_QUERIES:
+        _news_refresh_task = asyncio.create_task(refresh_loop())
+
+
+@app.on_event("shutdown")
+async def _shutdown():
+    if _news_refresh_task is not None:
+        _news_refresh_task.cancel()
+    if http_session is not None:
+        await http_session.close()
+    if cache is not None:
+        await cache.aclose()
+
+
+@app.get("/")
+def root():
+    return {
+        "name": "AI Pakar Keuangan & Investasi",
+        "model": GEMINI_MODEL_NAME,
+        "endpoints": ["/analyze", "/news", "/suggest-questions", "/bootstrap", "/session"],
+        "disclaimer": "Informasi bersifat edukatif, bukan nasihat keuangan personal.",
+    }
+
+
+ANALYZE_DISCLAIMER = "Konten untuk tujuan edukasi. Lakukan riset mandiri & konsultasi penasihat berizin."
+
+
+def _analyze_cache_key(req: AnalyzeRequest) -> str:
+    # Hanya field AnalyzeRequest, agar /bootstrap berbagi cache dengan /analyze
+    return _cache_key("analyze:", req.model_dump(include=set(AnalyzeRequest.model_fields)))
+
+
+# Ambang diturunkan dari MAX_PROMPT_CHARS (~4 karakter/token) agar tetap sejalan
+# bila anggaran prompt diubah
+ROUTE_LITE_MAX_TOKENS = MAX_PROMPT_CHARS // 16  # ~1/4 anggaran, diukur pada pertanyaan saja
+ROUTE_PRO_MIN_TOKENS = MAX_PROMPT_CHARS // 5  # ~80% anggaran, diukur pada seluruh prompt
+ROUTE_PRO_MIN_TICKERS = 3
+
+
+def pick_model_name(req: AnalyzeRequest, parts: List[dict], articles: List[dict]) -> str:
+    """Pilih tier model termurah yang memadai untuk request ini."""
+    toks = approx_tokens("".join(p["text"] for p in parts))
+    n_tickers = len(req.tickers or [])
+    # Lite untuk pertanyaan umum yang singkat: tanpa ticker/profil, dan berita (bila ada)
+    # hanya dari query fallback, bukan kata kunci pengguna. Panjang diukur pada
+    # pertanyaan, bukan seluruh prompt, agar pilihan tier tidak bergantung pada
+    # panjang judul/ringkasan berita fallback yang kebetulan terambil.
+    if (
+        approx_tokens(req.pertanyaan) < ROUTE_LITE_MAX_TOKENS
+        and not n_tickers
+        and req.profil is None
+        and (not articles or not req.kata_kunci)
+    ):
+        return GEMINI_MODEL_LITE
+    if toks > ROUTE_PRO_MIN_TOKENS or n_tickers >= ROUTE_PRO_MIN_TICKERS:
+        return GEMINI_MODEL_PRO
+    return GEMINI_MODEL_NAME
+
+
+def route_model(req: AnalyzeRequest, parts: List[dict], articles: List[dict]) -> genai.GenerativeModel:
+    name = pick_model_name(req, parts, articles)
+    logger.info(
+        "analyze model=%s tickers=%d profil=%s articles=%d prompt_chars=%d",
+        name, len(req.tickers or []), req.profil is not None, len(articles),
+        sum(len(p["text"]) for p in parts),
+    )
+    return get_models()[name]
+
+
+async def _resolve_session(req: AnalyzeRequest, sid: Optional[str]) -> None:
+    """Lengkapi req.profil dengan profil kanonik sesi (profil di request diutamakan)."""
+    if not sid:
+        return
+    session = await cache_get(f"session:{sid}")
+    if session is None:
+        raise HTTPException(status_code=404, detail="Sesi tidak ditemukan atau sudah kedaluwarsa.")
+    if req.profil is None:
+        req.profil = InvestorProfile(**session["profil"])
+
+
+async def _prepare_analyze(req: AnalyzeRequest) -> Tuple[List[str], List[dict], List[dict]]:
+    # 1) Rangkai term berita (satu query per ticker/kata kunci)
+    terms = build_news_terms(req)
+
+    # 2) Ambil berita
+    articles = await fetch_news_multi(terms, language=req.bahasa, from_days=req.hari_kebelakang)
+    news_ctx = build_news_context(articles)
+
+    # 3) Bangun prompt
+    return terms, articles, build_prompt(req.pertanyaan, req.profil, news_ctx)
+
+
+def _analyze_result(req: AnalyzeRequest, terms: List[str], articles: List[dict], answer: Optional[dict]) -> dict:
     return {
         "query": req.pertanyaan,
-        "news_query": q,
+        "news_query": " OR ".join(terms),  # dipertahankan untuk klien lama
+        "news_terms": terms,  # satu query NewsAPI per term
         "articles_count": len(articles),
-        "answer": teks,
-        "disclaimer": "Konten untuk tujuan edukasi. Lakukan riset mandiri & konsultasi penasihat berizin.",
+        "answer": answer,
+        "disclaimer": ANALYZE_DISCLAIMER,
     }
 
 
+async def _run_analyze(req: AnalyzeRequest, sid: Optional[str] = None) -> dict:
+    await _resolve_session(req, sid)
+    # Pertanyaan identik dalam jendela singkat dilayani dari cache
+    cache_key = _analyze_cache_key(req)
+    cached = await cache_get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Request identik yang datang bersamaan (cache masih kosong) berbagi satu panggilan Gemini
+    return await single_flight(cache_key, lambda: _compute_analyze(req, cache_key))
+
+
+async def _compute_analyze(req: AnalyzeRequest, cache_key: str) -> dict:
+    terms, articles, parts = await _prepare_analyze(req)
+    ctx = _semantic_ctx(req.bahasa, build_profile_part(req.profil), articles)
+    answer, vec = await semantic_lookup(req.pertanyaan, ctx)
+    if answer is not None:
+        result = {**_analyze_result(req, terms, articles, parse_analysis(answer)), "cached": True}
+    else:
+        cfg = gen_config(ANALYZE_GEN_CFG, req.max_output_tokens, req.temperature)
+        teks = await generate_text(parts, cfg, route_model(req, parts, articles))
+        result = _analyze_result(req, terms, articles, parse_analysis(teks))
+        await semantic_store(vec, ctx, teks)
+    await cache_set(cache_key, ANALYZE_CACHE_TTL, result)
+    return result
+
+
+async def _stream_analyze(req: AnalyzeRequest, sid: Optional[str] = None) -> StreamingResponse:
+    await _resolve_session(req, sid)
+    cache_key = _analyze_cache_key(req)
+    cached = await cache_get(cache_key)
+    if cached is not None:
+        return _sse_replay(cached)
+
+    # Berita diambil sebelum stream dibuka agar error NewsAPI tetap jadi status HTTP
+    terms, articles, parts = await _prepare_analyze(req)
+    ctx = _semantic_ctx(req.bahasa, build_profile_part(req.profil), articles)
+    answer, vec = await semantic_lookup(req.pertanyaan, ctx)
+    if answer is not None:
+        result = {**_analyze_result(req, terms, articles, parse_analysis(answer)), "cached": True}
+        await cache_set(cache_key, ANALYZE_CACHE_TTL, result)
+        return _sse_replay(result)
+
+    model = route_model(req, parts, articles)
+    meta = _analyze_result(req, terms, articles, None)
+    del meta["answer"]
+
+    async def finalize(teks: str) -> dict:
+        parsed = parse_analysis(teks)
+        await cache_set(cache_key, ANALYZE_CACHE_TTL, _analyze_result(req, terms, articles, parsed))
+        await semantic_store(vec, ctx, teks)
+        return {"answer": parsed}
+
+    cfg = gen_config(ANALYZE_GEN_CFG, req.max_output_tokens, req.temperature)
+    return _sse_response(_sse_generate(meta, parts, finalize, cfg, model))
+
+
+async def _run_suggest(topik: Optional[str], generation_config: dict = SUGGEST_GEN_CFG) -> List[str]:
+    teks = await generate_text(build_suggest_prompt(topik), generation_config)
+    return parse_suggestions_json(teks)
+
+
+@app.post("/session")
+async def create_session(profil: InvestorProfile):
+    """Daftarkan profil investor sekali; /analyze?sid=... lalu cukup mengirim berita + pertanyaan.
+
+    Profil disimpan dalam bentuk kanonik sehingga blok profil di prompt identik
+    byte-per-byte antar request sesi (prefix stabil untuk implicit caching Gemini).
+    """
+    sid = uuid4().hex
+    await cache_set(f"session:{sid}", SESSION_TTL, {"profil": profil.model_dump()})
+    return {"sid": sid, "expires_in": SESSION_TTL}
+
+
+@app.post("/analyze")
+async def analyze(req: AnalyzeRequest, stream: bool = True, sid: Optional[str] = None):
+    # Default: SSE agar klien melihat token pertama secepatnya; ?stream=false untuk JSON utuh
+    if stream:
+        return await _stream_analyze(req, sid)
+    return await _run_analyze(req, sid)
+
+
+NEWS_RESPONSE_VERSION = 1  # naikkan bila bentuk respons /news berubah
+
+
 @app.post("/news")
-def news(query: NewsQuery):
+async def news(query: NewsQuery):
     # Validasi tanggal
     frm = query.dari
     to = query.sampai
     params = {
         "q": query.q,
         "language": query.bahasa,
-        "sort_by": "publishedAt",
+        "sortBy": "publishedAt",
         "page": query.halaman,
-        "page_size": 20,
+        "pageSize": 20,
     }
 
     if frm:
-        params["from_param"] = frm
+        params["from"] = frm
     if to:
         params["to"] = to
 
-    res = newsapi.get_everything(**params)
+    # Cache menyimpan body JSON final (bytes), jadi hit tidak perlu decode/encode ulang.
+    # Versi bentuk respons ikut di key agar perubahan skema tidak menyajikan body lama.
+    cache_key = _cache_key("news_bytes:", {**params, "_v": NEWS_RESPONSE_VERSION})
+    cached = await cache_get_bytes(cache_key)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
+    res = await fetch_news_raw(params)
     if res.get("status") != "ok":
         raise HTTPException(status_code=502, detail=f"Gagal memuat berita: {res}")
 
-    articles = [
-        {
-            "judul": a.get("title"),
-            "sumber": a.get("source", {}).get("name"),
-            "url": a.get("url"),
-            "publishedAt": a.get("publishedAt"),
-            "ringkas": a.get("description"),
-        }
-        for a in res.get("articles", [])
-    ]
-    return {"total": res.get("totalResults", 0), "articles": articles}
+    articles = _map_articles(res.get("articles") or [])
+    payload = orjson.dumps({"total": res.get("totalResults", 0), "articles": articles})
+    await cache_set_bytes(cache_key, NEWS_CACHE_TTL, payload)
+    return Response(content=payload, media_type="application/json")
 
 
 @app.get("/suggest-questions")
-def suggest_questions(topik: Optional[str] = None):
-    prompt = (
-        "Buat 8 pertanyaan tajam seputar keuangan/investasi untuk membantu analisis. "
-        "Variasikan dari makro, sektor, emiten, manajemen risiko, dan perencanaan keuangan. "
-    )
-    if topik:
-        prompt += f"Fokus utama: {topik}. "
+async def suggest_questions(
+    topik: Optional[str] = None,
+    stream: bool = True,
+    max_output_tokens: Optional[int] = Query(default=None, ge=64, le=4096),
+    temperature: Optional[float] = Query(default=None, ge=0, le=2),
+):
+    cfg = gen_config(SUGGEST_GEN_CFG, max_output_tokens, temperature)
+    if not stream:
+        return {"suggestions": await _run_suggest(topik, cfg)}
 
-    try:
-        resp = model.generate_content(prompt)
-        teks = resp.text
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Gagal memanggil Gemini: {e}")
+    async def finalize(teks: str) -> dict:
+        return {"suggestions": parse_suggestions_json(teks)}
+
+    return _sse_response(_sse_generate({}, build_suggest_prompt(topik), finalize, cfg))
+
+
+@app.post("/bootstrap")
+async def bootstrap(req: BootstrapRequest):
+    """Gabungan /analyze + /suggest-questions untuk pemuatan awal halaman.
 
-    return {"suggestions": [s.strip("- •\n ") for s in teks.split("\n") if s.strip()]}
+    Kedua panggilan Gemini berjalan bersamaan, sehingga latensi total kira-kira
+    sebesar yang paling lambat, bukan jumlah keduanya.
+    """
+    analysis, suggestions = await asyncio.gather(_run_analyze(req), _run_suggest(req.topik))
+    return {"analysis": analysis, "suggestions": suggestions}